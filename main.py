@@ -1,15 +1,25 @@
+import asyncio
+import html
 import os
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
+from typing import Annotated, List, Optional, Dict, Any
 
+import orjson
+import redis.asyncio as redis_async
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 from database import db
 
-app = FastAPI(title="AptLearn – 15-Day Interview Preparation Portal API")
+app = FastAPI(
+    title="AptLearn – 15-Day Interview Preparation Portal API",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,23 +40,75 @@ def collection(name: str):
     return db[name]
 
 
-def seed_data():
+_SEEDED = False
+
+# Shared seed constants: one options tuple (BSON-encodes as an array) and one
+# prompt template instead of fresh allocations per question
+_SEED_OPTIONS = ("Option A", "Option B", "Option C", "Option D")
+_SEED_PROMPT = "Question {i} for Day {d}: Choose the correct option."
+
+# Cache-aside for effectively-immutable content (modules/days/questions);
+# entries expire after 5 minutes so out-of-band edits still surface
+_content_cache: TTLCache = TTLCache(maxsize=64, ttl=300)
+
+# Health probes hit /test constantly; re-run listCollections at most every 30s
+_health_cache: TTLCache = TTLCache(maxsize=1, ttl=30)
+
+# Optional shared cache so a scaled-out fleet warms once, not per process
+_redis = None
+redis_url = os.getenv("REDIS_URL")
+if redis_url:
+    _redis = redis_async.from_url(redis_url, max_connections=50)
+
+_REDIS_TTL = 600
+
+
+async def shared_cache_get(key: str):
+    if _redis is None:
+        return None
+    try:
+        raw = await _redis.get(key)
+    except Exception:
+        return None
+    return orjson.loads(raw) if raw else None
+
+
+async def shared_cache_set(key: str, value) -> None:
+    if _redis is None:
+        return
+    try:
+        await _redis.set(key, orjson.dumps(value), ex=_REDIS_TTL)
+    except Exception:
+        pass
+
+
+async def seed_data():
     """Seed modules, days and simple questions if not already present"""
+    global _SEEDED
+    if _SEEDED:
+        return
     modules_col = collection("module")
-    if modules_col.count_documents({}) > 0:
+    # estimated_document_count reads collection metadata instead of scanning
+    if await modules_col.estimated_document_count() > 0:
+        _SEEDED = True
         return
+    _SEEDED = True
 
     modules = [
         {"key": "aptitude", "title": "Aptitude", "order": 1},
         {"key": "technical", "title": "Technical", "order": 2},
         {"key": "hr", "title": "HR", "order": 3},
     ]
-    modules_col.insert_many(modules)
+    await modules_col.insert_many(modules)
 
     days_col = collection("day")
     questions_col = collection("question")
 
+    now = datetime.now(timezone.utc)
+
     # Create 15 days, 1-5 aptitude, 6-10 technical, 11-15 HR
+    all_days = []
+    all_questions = []
     for d in range(1, 16):
         if d <= 5:
             mk = "aptitude"
@@ -58,39 +120,50 @@ def seed_data():
             mk = "hr"
             title = f"HR Day {d-10}"
 
-        day_doc = {
+        all_days.append({
             "day_number": d,
             "module_key": mk,
             "title": title,
             "video_url": "https://www.youtube.com/embed/dQw4w9WgXcQ",
             "notes": f"Concise notes for {title}. Key concepts, examples, and tips.",
-            "created_at": datetime.now(timezone.utc),
-            "updated_at": datetime.now(timezone.utc),
-        }
-        days_col.insert_one(day_doc)
+            "created_at": now,
+            "updated_at": now,
+        })
 
         # Add 5 simple MCQs for each day
-        qs = []
         for i in range(1, 6):
-            prompt = f"Question {i} for Day {d}: Choose the correct option."
-            options = ["Option A", "Option B", "Option C", "Option D"]
-            answer_index = (i - 1) % 4
-            qs.append({
+            all_questions.append({
                 "day_number": d,
-                "prompt": prompt,
-                "options": options,
-                "answer_index": answer_index,
-                "created_at": datetime.now(timezone.utc),
-                "updated_at": datetime.now(timezone.utc),
+                "prompt": _SEED_PROMPT.format(i=i, d=d),
+                "options": _SEED_OPTIONS,
+                "answer_index": (i - 1) % 4,
+                "created_at": now,
+                "updated_at": now,
             })
-        questions_col.insert_many(qs)
+
+    # Two batched writes instead of one round-trip per day
+    await days_col.insert_many(all_days, ordered=False)
+    await questions_col.insert_many(all_questions, ordered=False)
+
+
+async def ensure_indexes():
+    """Create the indexes backing the hot lookups; no-op if they already exist"""
+    await collection("module").create_index("order")
+    await collection("question").create_index("day_number")
+    await collection("day").create_index("day_number", unique=True)
+    await collection("day").create_index("module_key")
+    await collection("user").create_index("email", unique=True)
+    await collection("progress").create_index("user_id", unique=True)
+    await collection("certificate").create_index("user_id", unique=True)
+    await collection("attempt").create_index([("user_id", 1), ("day_number", 1)])
 
 
 @app.on_event("startup")
 async def on_startup():
     try:
         if db is not None:
-            seed_data()
+            await seed_data()
+            await ensure_indexes()
     except Exception:
         pass
 
@@ -100,14 +173,18 @@ async def on_startup():
 # -----------------
 
 class UserIn(BaseModel):
-    name: str
-    email: str
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    name: str = Field(..., min_length=1, max_length=200)
+    email: EmailStr
 
 class AttemptIn(BaseModel):
-    user_id: str
-    day_number: int
-    answers: List[int]
-    violations: int = 0
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    user_id: str = Field(..., max_length=64)
+    day_number: int = Field(..., ge=1, le=15)
+    answers: List[Annotated[int, Field(ge=0, le=10)]] = Field(..., max_length=50)
+    violations: int = Field(0, ge=0, le=10000)
 
 
 # -----------------
@@ -123,7 +200,7 @@ def hello():
     return {"message": "Hello from the backend API!"}
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -139,7 +216,10 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = _health_cache.get("collections")
+                if collections is None:
+                    collections = await db.list_collection_names()
+                    _health_cache["collections"] = collections
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -157,77 +237,124 @@ def test_database():
 # -----------------
 
 @app.post("/users")
-def create_or_get_user(user: UserIn):
+async def create_or_get_user(user: UserIn):
     users = collection("user")
-    existing = users.find_one({"email": user.email})
+    existing = await users.find_one({"email": user.email})
     if existing:
         return {"id": str(existing.get("_id")), "name": existing.get("name"), "email": existing.get("email")}
+    now = datetime.now(timezone.utc)
     doc = {
         "name": user.name,
         "email": user.email,
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
+        "created_at": now,
+        "updated_at": now,
     }
-    res = users.insert_one(doc)
+    res = await users.insert_one(doc)
     # create progress
-    collection("progress").insert_one({
+    await collection("progress").insert_one({
         "user_id": str(res.inserted_id),
         "completed_days": [],
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
+        "created_at": now,
+        "updated_at": now,
     })
     return {"id": str(res.inserted_id), "name": user.name, "email": user.email}
 
 
 @app.get("/modules")
-def get_modules():
-    mods = list(collection("module").find({}, {"_id": 0}))
-    return sorted(mods, key=lambda m: m.get("order", 0))
+async def get_modules():
+    cached = _content_cache.get("modules")
+    if cached is not None:
+        return cached
+    mods = await shared_cache_get("aptlearn:modules")
+    if mods is None:
+        mods = await collection("module").find({}, {"_id": 0}).sort("order", 1).to_list(length=1000)
+        await shared_cache_set("aptlearn:modules", mods)
+    _content_cache["modules"] = mods
+    return mods
 
 
 @app.get("/days")
-def get_days(module_key: Optional[str] = None):
+async def get_days(module_key: Optional[str] = None):
+    cache_key = ("days", module_key)
+    cached = _content_cache.get(cache_key)
+    if cached is not None:
+        return cached
     filt: Dict[str, Any] = {}
     if module_key:
         filt["module_key"] = module_key
-    days = list(collection("day").find(filt, {"_id": 0}))
-    return sorted(days, key=lambda d: d.get("day_number", 0))
+    days = await collection("day").find(filt, {"_id": 0}).sort("day_number", 1).to_list(length=1000)
+    _content_cache[cache_key] = days
+    return days
 
 
 @app.get("/day/{day_number}")
-def get_day(day_number: int):
-    d = collection("day").find_one({"day_number": day_number}, {"_id": 0})
-    if not d:
-        raise HTTPException(status_code=404, detail="Day not found")
+async def get_day(day_number: int):
+    cache_key = ("day", day_number)
+    cached = _content_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    d = await shared_cache_get(f"aptlearn:day:{day_number}")
+    if d is None:
+        d = await collection("day").find_one({"day_number": day_number}, {"_id": 0})
+        if not d:
+            raise HTTPException(status_code=404, detail="Day not found")
+        await shared_cache_set(f"aptlearn:day:{day_number}", d)
+    _content_cache[cache_key] = d
     return d
 
 
 @app.get("/quiz/{day_number}")
-def get_quiz(day_number: int):
-    qs = list(collection("question").find({"day_number": day_number}, {"_id": 0}))
-    if not qs:
-        raise HTTPException(status_code=404, detail="Quiz not found for this day")
-    # do not reveal answers
-    for q in qs:
-        q.pop("answer_index", None)
-    return {"day_number": day_number, "questions": qs}
+async def get_quiz(day_number: int):
+    cache_key = ("quiz", day_number)
+    cached = _content_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    payload = await shared_cache_get(f"aptlearn:quiz:{day_number}")
+    if payload is None:
+        # project out the answers server-side so they never cross the wire
+        qs = await collection("question").find(
+            {"day_number": day_number}, {"answer_index": 0, "_id": 0}
+        ).to_list(length=1000)
+        if not qs:
+            raise HTTPException(status_code=404, detail="Quiz not found for this day")
+        payload = {"day_number": day_number, "questions": qs}
+        await shared_cache_set(f"aptlearn:quiz:{day_number}", payload)
+    _content_cache[cache_key] = payload
+    return payload
 
 
 @app.post("/attempt")
-def submit_attempt(payload: AttemptIn):
-    # Fetch questions to score
-    qdocs = list(collection("question").find({"day_number": payload.day_number}))
-    if not qdocs:
+async def submit_attempt(payload: AttemptIn):
+    # Score on the server: pair each answer key with the submitted answer
+    # ($zip truncates to the shorter array) and count the matches, so only
+    # two ints cross the wire instead of every question document
+    pipeline = [
+        {"$match": {"day_number": payload.day_number}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": None, "keys": {"$push": "$answer_index"}}},
+        {"$project": {
+            "_id": 0,
+            "total": {"$size": "$keys"},
+            "score": {"$size": {"$filter": {
+                "input": {"$zip": {"inputs": ["$keys", {"$literal": payload.answers}]}},
+                "as": "pair",
+                "cond": {"$eq": [
+                    {"$arrayElemAt": ["$$pair", 0]},
+                    {"$arrayElemAt": ["$$pair", 1]},
+                ]},
+            }}},
+        }},
+    ]
+    scored = await collection("question").aggregate(pipeline).to_list(length=1)
+    if not scored:
         raise HTTPException(status_code=400, detail="No questions for this day")
 
-    total = len(qdocs)
-    score = 0
-    for i, q in enumerate(qdocs):
-        if i < len(payload.answers) and payload.answers[i] == q.get("answer_index"):
-            score += 1
+    total = scored[0]["total"]
+    score = scored[0]["score"]
 
     flagged = payload.violations > 0
 
+    now = datetime.now(timezone.utc)
     attempts = collection("attempt")
     doc = {
         "user_id": payload.user_id,
@@ -237,67 +364,70 @@ def submit_attempt(payload: AttemptIn):
         "total": total,
         "violations": payload.violations,
         "flagged": flagged,
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
+        "created_at": now,
+        "updated_at": now,
     }
-    attempts.insert_one(doc)
+    await attempts.insert_one(doc)
 
     # Passing criteria: at least 60% and no violations
     passed = (score / total) >= 0.6 and not flagged
 
-    # Update progress if passed
+    # Update progress if passed; $addToSet is atomic so concurrent attempts can't lose updates,
+    # and returning the post-update document folds the certificate check into the same round-trip
     if passed:
-        prog_col = collection("progress")
-        prog = prog_col.find_one({"user_id": payload.user_id})
-        if prog:
-            completed_days = prog.get("completed_days", [])
-            if payload.day_number not in completed_days:
-                completed_days.append(payload.day_number)
-                prog_col.update_one(
-                    {"_id": prog["_id"]},
-                    {"$set": {"completed_days": completed_days, "updated_at": datetime.now(timezone.utc)}}
-                )
-
-    # Check progress to possibly create certificate
-    prog = collection("progress").find_one({"user_id": payload.user_id})
-    if prog and len(prog.get("completed_days", [])) >= 15:
-        cert_col = collection("certificate")
-        existing = cert_col.find_one({"user_id": payload.user_id})
-        if not existing:
-            name = "Participant"
-            try:
-                user_doc = collection("user").find_one({"_id": ObjectId(payload.user_id)})
-                if user_doc and user_doc.get("name"):
-                    name = user_doc["name"]
-            except Exception:
-                user_doc = collection("user").find_one({"email": {"$exists": True}})
-                if user_doc and user_doc.get("name"):
-                    name = user_doc["name"]
-
-            now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
-            svg = generate_certificate_svg(name=name, date_str=now)
-            cert_col.insert_one({
-                "user_id": payload.user_id,
-                "name": name,
-                "issued_at": now,
-                "svg": svg,
-                "created_at": datetime.now(timezone.utc),
-            })
+        prog = await collection("progress").find_one_and_update(
+            {"user_id": payload.user_id},
+            {
+                "$addToSet": {"completed_days": payload.day_number},
+                "$set": {"updated_at": now},
+            },
+            projection={"completed_days": 1},
+            return_document=ReturnDocument.AFTER,
+            upsert=True,
+        )
+        if prog and len(prog.get("completed_days", [])) == 15:
+            # Issue off the request path; the client only needs the score
+            asyncio.create_task(issue_certificate(payload.user_id))
 
     return {"score": score, "total": total, "passed": passed, "flagged": flagged, "violations": payload.violations}
 
 
+async def issue_certificate(user_id: str):
+    """Render and store the completion certificate for a user"""
+    name = "Participant"
+    if ObjectId.is_valid(user_id):
+        user_doc = await collection("user").find_one({"_id": ObjectId(user_id)})
+        if user_doc and user_doc.get("name"):
+            name = user_doc["name"]
+
+    now = datetime.now(timezone.utc)
+    issued_at = now.strftime("%Y-%m-%d %H:%M UTC")
+    svg = generate_certificate_svg(name=name, date_str=issued_at)
+    # Atomic: inserts once, no-op when the certificate already exists
+    await collection("certificate").update_one(
+        {"user_id": user_id},
+        {"$setOnInsert": {
+            "user_id": user_id,
+            "name": name,
+            "issued_at": issued_at,
+            "svg": svg,
+            "created_at": now,
+        }},
+        upsert=True,
+    )
+
+
 @app.get("/progress/{user_id}")
-def get_progress(user_id: str):
-    prog = collection("progress").find_one({"user_id": user_id}, {"_id": 0})
+async def get_progress(user_id: str):
+    prog = await collection("progress").find_one({"user_id": user_id}, {"_id": 0})
     if not prog:
         return {"user_id": user_id, "completed_days": []}
     return prog
 
 
 @app.get("/certificate/{user_id}")
-def get_certificate(user_id: str):
-    cert = collection("certificate").find_one({"user_id": user_id}, {"_id": 0})
+async def get_certificate(user_id: str):
+    cert = await collection("certificate").find_one({"user_id": user_id}, {"_id": 0})
     if not cert:
         raise HTTPException(status_code=404, detail="Certificate not issued yet")
     return cert
@@ -307,8 +437,8 @@ def get_certificate(user_id: str):
 # Certificate SVG
 # -----------------
 
-def generate_certificate_svg(name: str, date_str: str) -> str:
-    return f'''<svg xmlns="http://www.w3.org/2000/svg" width="1200" height="850">
+# Template split once at import time; only name and date vary per certificate
+_SVG_HEAD, _SVG_REST = '''<svg xmlns="http://www.w3.org/2000/svg" width="1200" height="850">
   <defs>
     <linearGradient id="g" x1="0" y1="0" x2="1" y2="1">
       <stop offset="0%" stop-color="#1e3a8a"/>
@@ -325,7 +455,13 @@ def generate_certificate_svg(name: str, date_str: str) -> str:
   <text x="600" y="590" text-anchor="middle" fill="#93c5fd" font-size="20" font-family="Inter, sans-serif">Issued on {date_str}</text>
   <circle cx="600" cy="690" r="36" fill="url(#g)"/>
   <text x="600" y="700" text-anchor="middle" fill="#0b1220" font-size="24" font-weight="700" font-family="Inter, sans-serif">AL</text>
-</svg>'''
+</svg>'''.split("{name}", 1)
+_SVG_MID, _SVG_TAIL = _SVG_REST.split("{date_str}", 1)
+
+
+def generate_certificate_svg(name: str, date_str: str) -> str:
+    # escape user-supplied name so it can't inject SVG markup
+    return _SVG_HEAD + html.escape(name, quote=True) + _SVG_MID + date_str + _SVG_TAIL
 
 
 if __name__ == "__main__":